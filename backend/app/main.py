@@ -1,17 +1,58 @@
+import asyncio
+import hashlib
 import os
+import pickle
+import threading
 import uuid
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from contextlib import asynccontextmanager, suppress
+import numpy as np
+from fastapi import FastAPI, UploadFile, File, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from .pdf_parser import extract_text_with_coordinates
-from .nlp import split_into_sentences
-from .tts import tts_sentence_to_wav, list_voice_styles
+from . import nlp, pdf_parser
+from .pdf_parser import extract_text_with_coordinates, shutdown_executor, FLAG_CONTINUATION
+from .nlp import split_into_sentences, get_nlp
+from .tts import tts_sentence_to_wav, tts_stream_wav, list_voice_styles
+from .tts_worker import TTSPrefetcher
 
 API_PREFIX = "/api"
 AUDIO_DIR = "/data/audio"
+CACHE_DIR = "/data/cache"  # not served, unlike AUDIO_DIR
+STATIC_DIR = "/static"
 
-app = FastAPI(title="PDF TTS")
+# Number of parsed PDFs kept in CACHE_DIR; the least recently used are evicted
+CACHE_MAX_ENTRIES = int(os.environ.get("PDF_CACHE_MAX_ENTRIES", "256"))
+# Cached results depend on these settings, so they are part of the cache key
+_CACHE_TAG = hashlib.sha256(repr((
+    1,  # bump when the cached result format changes
+    pdf_parser.CHAR_LEVEL_BBOX,
+    pdf_parser.DETECT_TABLES,
+    nlp.SPACY_MODEL,
+    nlp.SPACY_EXCLUDE,
+)).encode()).hexdigest()[:16]
+
+# Every char str.isspace() accepts (all of them are below U+3001), used to
+# strip whitespace with str.translate and to mask it with numpy
+_WHITESPACE = "".join(chr(c) for c in range(0x3001) if chr(c).isspace())
+_WHITESPACE_CODES = np.array([ord(c) for c in _WHITESPACE], dtype=np.uint32)
+_STRIP_WHITESPACE = str.maketrans("", "", _WHITESPACE)
+
+_prefetcher = TTSPrefetcher()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load spaCy in the background so the first upload doesn't pay for it
+    threading.Thread(target=get_nlp, daemon=True).start()
+    # Start the TTS prefetch worker now; it loads its own copy of the model
+    await asyncio.to_thread(_prefetcher.warm_up)
+    yield
+    # Both wait for their worker processes to exit
+    await asyncio.to_thread(_prefetcher.stop)
+    await asyncio.to_thread(shutdown_executor)
+
+app = FastAPI(title="PDF TTS", default_response_class=ORJSONResponse, lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # tighten in prod
@@ -21,90 +62,174 @@ app.add_middleware(
 )
 
 os.makedirs(AUDIO_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
+os.makedirs(STATIC_DIR, exist_ok=True)
+
+def _box_dicts(char_map: dict, rows: np.ndarray):
+    """
+    Materializes the char_map rows as {p, x, y, w, h} boxes for the JSON response.
+    
+    Boxes have a bottom-left origin; the page sizes they are relative to are
+    sent once per page (see _page_sizes).
+    """
+    # Round in float64 so float32 artifacts don't bloat the JSON
+    columns = [char_map[k][rows].astype(np.float64).round(2).tolist() for k in ("x", "y", "width", "height")]
+    return [
+        {"p": page, "x": x, "y": y, "w": width, "h": height}
+        for page, x, y, width, height in zip(char_map["page"][rows].tolist(), *columns)
+    ]
+
+def _bboxes(char_map: dict, starts: np.ndarray, ends: np.ndarray):
+    """Returns the boxes of char_map[start:end] for every (start, end) pair."""
+    # Chars continuing a word-level box don't get a box of their own, so only
+    # box rows are materialized, once for the whole document
+    box_rows = np.flatnonzero((char_map["flags"] & FLAG_CONTINUATION) == 0)
+    boxes = _box_dicts(char_map, box_rows)
+    
+    lo = np.searchsorted(box_rows, starts)
+    hi = np.searchsorted(box_rows, ends)
+    # Ranges starting in the middle of a word still get that word's box
+    mid_word = np.ones(len(starts), dtype=bool)
+    if len(box_rows):
+        mid_word = box_rows[np.minimum(lo, len(box_rows) - 1)] != starts
+    first_boxes = iter(_box_dicts(char_map, starts[mid_word]))
+    
+    return [
+        [next(first_boxes), *boxes[l:h]] if mid else boxes[l:h]
+        for l, h, mid in zip(lo.tolist(), hi.tolist(), mid_word.tolist())
+    ]
+
+def _page_sizes(char_map: dict):
+    return {
+        str(page): {"w": width, "h": height}
+        for page, (width, height) in char_map["page_sizes"].items()
+    }
+
+def _attach_bboxes(text: str, char_map: dict, sentences: list):
+    """
+    Maps each sentence to the bounding boxes of its characters in `text`.
+
+    `split_into_sentences` yields sentences in reading order and only drops
+    whitespace, so the non-whitespace characters of all sentences are exactly
+    the non-whitespace characters of `text`. Sentences are therefore aligned by
+    walking a cursor over the non-whitespace positions once instead of
+    re-scanning the text for every sentence.
+    """
+    # 1. Precompute the positions of all non-whitespace characters in 'text'
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    ns_idx = np.flatnonzero(~np.isin(codes, _WHITESPACE_CODES))
+    text_clean = text.translate(_STRIP_WHITESPACE)
+
+    k = 0  # cursor into ns_idx / text_clean
+    matched = []
+    matches = []
+    clean_lens = []
+    for s in sentences:
+        # 2. Create a "clean" version of the sentence for matching (no whitespace)
+        s_text_clean = s["text"].translate(_STRIP_WHITESPACE)
+        clean_len = len(s_text_clean)
+        s["bboxes"] = []
+
+        if not clean_len:
+            continue
+
+        # 3. The sentence should start right at the cursor; only search forward
+        # if it does not (e.g. the sentence splitter altered the text)
+        if text_clean.startswith(s_text_clean, k):
+            match = k
+        else:
+            match = text_clean.find(s_text_clean, k)
+
+        if match == -1:
+            # If strict match fails, we skip this sentence (or could log a warning)
+            continue
+
+        matched.append(s)
+        matches.append(match)
+        clean_lens.append(clean_len)
+        k = match + clean_len
+
+    # 4. Map the matches back to 'text' and build all boxes in one batch
+    matches = np.array(matches, dtype=np.intp)
+    starts = ns_idx[matches]
+    ends = ns_idx[matches + np.array(clean_lens, dtype=np.intp) - 1] + 1
+    for s, boxes in zip(matched, _bboxes(char_map, starts, ends)):
+        s["bboxes"] = boxes
+
+    return sentences
+
+def _save_upload(file: UploadFile, pdf_path: str) -> str:
+    """Streams the upload to pdf_path and returns the SHA-256 hex digest of its bytes."""
+    sha256 = hashlib.sha256()
+    # Stream to a temporary name first so a partially written PDF is never served
+    tmp_path = f"{pdf_path}.part"
+    with open(tmp_path, "wb") as f:
+        while chunk := file.file.read(1 << 20):
+            sha256.update(chunk)
+            f.write(chunk)
+    os.replace(tmp_path, pdf_path)
+    return sha256.hexdigest()
+
+def _evict_cache():
+    """Removes all but the CACHE_MAX_ENTRIES most recently used cache entries."""
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith(".pkl"):
+            # Entries can disappear while another upload evicts them
+            with suppress(FileNotFoundError):
+                entries.append((entry.stat().st_mtime, entry.path))
+    entries.sort(reverse=True)
+    for _, path in entries[CACHE_MAX_ENTRIES:]:
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+def _process_pdf(pdf_path: str, key: str):
+    # Re-uploads of the same PDF are served from the cache instead of being re-parsed
+    cache_path = os.path.join(CACHE_DIR, f"{key}-{_CACHE_TAG}.pkl")
+    try:
+        with open(cache_path, "rb") as f:
+            result = pickle.load(f)
+    except FileNotFoundError:
+        pass
+    else:
+        with suppress(FileNotFoundError):
+            os.utime(cache_path)  # mark as recently used
+        return result
+    
+    text, char_map = extract_text_with_coordinates(pdf_path)
+    sentences = split_into_sentences(text)
+    result = {
+        "pages": _page_sizes(char_map),
+        "sentences": _attach_bboxes(text, char_map, sentences),
+    }
+    
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.part"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    _evict_cache()
+    return result
 
 @app.post(f"{API_PREFIX}/upload")
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(response: Response, file: UploadFile = File(...)):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Please upload a PDF file.")
     
     # Generate unique ID for this upload
     upload_id = str(uuid.uuid4())
     pdf_filename = f"{upload_id}.pdf"
-    pdf_path = os.path.join("/static", pdf_filename)
-    os.makedirs("/static", exist_ok=True)
+    pdf_path = os.path.join(STATIC_DIR, pdf_filename)
     
-    content = await file.read()
-    with open(pdf_path, "wb") as f:
-        f.write(content)
+    key = await asyncio.to_thread(_save_upload, file, pdf_path)
+    response.headers["ETag"] = f'"{key}"'
         
-    text, char_map = extract_text_with_coordinates(content)
-    
-    sentences = split_into_sentences(text)
+    # Parsing and sentence splitting are CPU-bound; keep them off the event loop
+    result = await asyncio.to_thread(_process_pdf, pdf_path, key)
     
-    # Map sentences to bounding boxes by finding each sentence in the extracted text
-    current_idx = 0
-    enriched_sentences = []
-    
-    for s in sentences:
-        s_text = s["text"]
-        
-        # 1. Create a "clean" version of the sentence for matching (no whitespace)
-        s_text_clean = "".join(s_text.split())
-        
-        if not s_text_clean:
-            s["bboxes"] = []
-            enriched_sentences.append(s)
-            continue
-            
-        # 2. Scan 'text' starting from current_idx to find the sequence of chars in s_text_clean
-        match_start = -1
-        match_end = -1
-        s_ptr = 0
-        
-        temp_idx = current_idx
-        
-        # Search for the sentence in the text
-        while temp_idx < len(text) and s_ptr < len(s_text_clean):
-            char = text[temp_idx]
-            
-            # Skip whitespace in the source text
-            if char.isspace():
-                temp_idx += 1
-                continue
-                
-            # Check for match
-            if char == s_text_clean[s_ptr]:
-                if match_start == -1:
-                    match_start = temp_idx
-                s_ptr += 1
-                temp_idx += 1
-            else:
-                # Mismatch
-                if match_start != -1:
-                    # We were matching but failed. Reset and try again from next char.
-                    # This handles cases where the same word appears multiple times.
-                    temp_idx = match_start + 1
-                    match_start = -1
-                    s_ptr = 0
-                else:
-                    # Haven't found start yet, keep looking
-                    temp_idx += 1
-        
-        # Check if we found the full sentence
-        if match_start != -1 and s_ptr == len(s_text_clean):
-            match_end = temp_idx
-            # Extract bboxes for the matched range
-            bboxes = char_map[match_start:match_end]
-            s["bboxes"] = bboxes
-            current_idx = match_end
-        else:
-            # If strict match fails, we skip this sentence (or could log a warning)
-            # We no longer fallback to simple find() as it's unreliable with layout changes
-            s["bboxes"] = []
-            
-        enriched_sentences.append(s)
+    # Audio is prefetched from the first sentence request, in its voice and speed
+    await asyncio.to_thread(_prefetcher.start, upload_id, [s["text"] for s in result["sentences"]])
 
-    return {"sentences": enriched_sentences, "pdfUrl": f"/{pdf_filename}"}
+    return {**result, "uploadId": upload_id, "pdfUrl": f"/{pdf_filename}"}
 
 @app.get(f"{API_PREFIX}/voices")
 async def get_voices():
@@ -120,14 +245,33 @@ async def synthesize_sentence(payload: dict):
     if not text:
         raise HTTPException(status_code=400, detail="Missing 'text' in payload.")
         
-    path = tts_sentence_to_wav(text, AUDIO_DIR, voice_style=voice, speed=speed)
+    path = await asyncio.to_thread(tts_sentence_to_wav, text, AUDIO_DIR, voice_style=voice, speed=speed)
     rel = os.path.relpath(path, "/")
     url = f"/{rel}"
     return {"audioUrl": url}
 
-# Serve audio files
-app.mount("/data", StaticFiles(directory="/data"), name="data")
+@app.get(f"{API_PREFIX}/tts_stream")
+async def stream_sentence(text: str, voice: str = "M1.json", speed: float = 1.0):
+    if not text:
+        raise HTTPException(status_code=400, detail="Missing 'text'.")
+    
+    # Synthesize sentence by sentence so playback can start after the first one
+    sentences = await asyncio.to_thread(split_into_sentences, text)
+    texts = [s["text"] for s in sentences] or [text]
+    return StreamingResponse(tts_stream_wav(texts, voice_style=voice, speed=speed), media_type="audio/wav")
+
+@app.get(f"{API_PREFIX}/tts_stream/{{upload_id}}/{{sentence_id}}")
+async def stream_uploaded_sentence(upload_id: str, sentence_id: int, voice: str = "M1.json", speed: float = 1.0):
+    # Only the sentences of the most recent upload are prefetched
+    if not _prefetcher.has_sentence(upload_id, sentence_id):
+        raise HTTPException(status_code=404, detail="Unknown sentence.")
+    wav = await asyncio.to_thread(_prefetcher.get, upload_id, sentence_id, voice, speed)
+    if wav is None:
+        raise HTTPException(status_code=503, detail="Sentence audio is not available.")
+    return Response(content=wav, media_type="audio/wav")
+
+# Serve audio files (and nothing else under /data, e.g. the parse cache)
+app.mount("/data/audio", StaticFiles(directory=AUDIO_DIR), name="audio")
 
 # Mount static files last to avoid shadowing API routes
-if os.path.isdir("/static"):
-    app.mount("/", StaticFiles(directory="/static", html=True), name="static")
+app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="static")
@@ -1,27 +1,58 @@
+import functools
+import os
+import threading
 import spacy
 
-# Load at module import (cached in container)
-_nlp = spacy.load("en_core_web_sm")
+SPACY_BATCH_SIZE = int(os.environ.get("SPACY_BATCH_SIZE", "256"))
+SPACY_N_PROCESS = int(os.environ.get("SPACY_N_PROCESS", "1"))
+
+# Only sentence boundaries are needed, so skip the tagger/parser/NER and use the
+# rule-based sentencizer instead of the dependency parser. A heavier model can be
+# configured (e.g. en_core_web_trf keeping its "transformer" and "parser").
+SPACY_MODEL = os.environ.get("SPACY_MODEL", "en_core_web_sm")
+SPACY_EXCLUDE = tuple(
+    c for c in os.environ.get(
+        "SPACY_EXCLUDE", "tok2vec,tagger,parser,attribute_ruler,lemmatizer,ner"
+    ).split(",") if c
+)
+# Run the pipeline on the GPU when one is available. Only worth it when the
+# configured pipeline keeps neural components; the sentencizer is rule-based.
+SPACY_GPU = os.environ.get("SPACY_GPU", "0") == "1"
+
+_nlp_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _load_nlp(model_name: str, exclude: tuple):
+    if SPACY_GPU:
+        # Falls back to the CPU if cupy or a GPU is missing
+        spacy.prefer_gpu()
+    nlp = spacy.load(model_name, exclude=list(exclude))
+    # Use the sentencizer unless the pipeline still has a component setting sentence boundaries
+    if not (nlp.has_pipe("parser") or nlp.has_pipe("senter")):
+        nlp.add_pipe("sentencizer")
+    return nlp
+
+def get_nlp():
+    """Loads the pipeline on first use; the lock keeps concurrent callers from loading it twice."""
+    with _nlp_lock:
+        return _load_nlp(SPACY_MODEL, SPACY_EXCLUDE)
 
 def split_into_sentences(text: str):
     # 1. Split by double newlines first to enforce hard boundaries (headers, paragraphs)
     # This respects the layout analysis from pdf_parser.py
-    chunks = text.split("\n\n")
-    
+    chunks = [c.strip() for c in text.split("\n\n")]
+    chunks = [c for c in chunks if c]
+
     sentences = []
     global_id = 0
-    
-    for chunk in chunks:
-        chunk = chunk.strip()
-        if not chunk:
-            continue
-            
-        # 2. Process each chunk with spacy
-        doc = _nlp(chunk)
+
+    # 2. Process all chunks in batches with spacy
+    docs = get_nlp().pipe(chunks, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS)
+    for doc in docs:
         for sent in doc.sents:
             s = sent.text.strip()
             if s:
                 sentences.append({"id": global_id, "text": s})
                 global_id += 1
-                
+
     return sentences
@@ -1,154 +1,286 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
 import fitz  # PyMuPDF
+import numpy as np
+
+# Emit one bounding box per character (from rawdict) instead of one per word.
+# Word boxes are enough to highlight sentences and are far cheaper to extract.
+CHAR_LEVEL_BBOX = False
+
+# Drop blocks inside tables found by page.find_tables(). Table detection runs a
+# full layout analysis per page and often costs as much as text extraction, so
+# it can be turned off (PDF_DETECT_TABLES=0) at the price of reading tables
+# aloud; images and headers/footers are always filtered. Read from the
+# environment so spawned parsing workers see the same setting.
+DETECT_TABLES = os.environ.get("PDF_DETECT_TABLES", "1") == "1"
+
+# Documents with at least PARALLEL_MIN_PAGES pages are parsed in worker
+# processes. PyMuPDF is not thread-safe, so each worker opens its own copy.
+PARSE_WORKERS = int(os.environ.get("PDF_PARSE_WORKERS", min(8, os.cpu_count() or 1)))
+PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "16"))
 
-def extract_text_with_coordinates(data: bytes):
+TEXT_FLAGS = fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE
+
+# Bits of char_map["flags"]
+FLAG_SPACE = 1         # synthetic space inserted between lines/words
+FLAG_NEWLINE = 2       # synthetic newline inserted between blocks
+FLAG_CONTINUATION = 4  # shares the box of the preceding char (word-level boxes)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _block_chars(block: dict):
     """
-    Extracts text and character coordinates from PDF bytes using PyMuPDF's rawdict.
+    Builds (block_text, block_chars) from a rawdict block, one box per char.
     
-    Features:
-    - Uses `rawdict` for exact character bounding boxes.
-    - Filters tables, headers/footers, and images.
-    - Enforces double newlines for block separation.
-    
-    Returns:
-        full_text (str): The complete text of the PDF.
-        char_map (list): List of {page, x, y, width, height} for each char.
+    block_chars holds (x0, y0, x1, y1, flags) rows in PyMuPDF (top-left origin)
+    coordinates; _process_page converts them for the whole page at once.
     """
-    doc = fitz.open(stream=data, filetype="pdf")
+    line_parts = []
+    block_chars = []
     
-    full_text = ""
-    char_map = []
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        page_height = page.rect.height
-        page_width = page.rect.width
-        
-        # 1. Detect Tables
-        tables = page.find_tables()
-        table_bboxes = [fitz.Rect(t.bbox) for t in tables]
+    for line in block.get("lines", []):
+        # Sort spans
+        spans = sorted(line.get("spans", []), key=lambda s: s["bbox"][0])
         
-        # 2. Detect Images
-        image_bboxes = []
-        for img in page.get_images():
-            rects = page.get_image_rects(img[0])
-            image_bboxes.extend(rects)
-            
-        # 3. Define Header/Footer Regions (5% margin)
-        header_height = page_height * 0.05
-        footer_y = page_height * 0.95
+        # rawdict 'chars' list contains individual characters with exact bboxes
+        chars = [c for span in spans for c in span.get("chars", []) if c.get("c")]
+        if not chars:
+            continue
         
-        # 4. Get Text with rawdict (provides individual characters)
-        # flags=fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE
-        text_page = page.get_text("rawdict", flags=fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE)
-        blocks = text_page.get("blocks", [])
-        text_blocks = [b for b in blocks if b.get("type") == 0]
+        line_text = "".join(c["c"] for c in chars)
+        line_parts.append(line_text)
+        block_chars.extend((*c["bbox"], 0) for c in chars)
         
-        # 5. Sort Blocks (Top-to-bottom, Left-to-right)
-        # We use a smaller vertical tolerance (10px) to group lines better
-        sorted_blocks = sorted(text_blocks, key=lambda b: (b["bbox"][1] // 10, b["bbox"][0]))
+        # Add space if line doesn't end with whitespace
+        if not line_text.endswith((" ", "\n", "\t")):
+            line_parts.append(" ")
+            x0, y0, x1, y1 = chars[-1]["bbox"]
+            # width approximates the space width
+            block_chars.append((x1, y0, 2 * x1 - x0, y1, FLAG_SPACE))
+    
+    return "".join(line_parts), block_chars
+
+def _block_words(words: list):
+    """
+    Builds (block_text, block_chars) from `get_text("words")` tuples.
+    
+    Every char of a word carries the word's box; all but the first are flagged
+    FLAG_CONTINUATION so consumers emit a single box per word. Words (and lines)
+    are joined with a single space that continues the preceding word's box.
+    """
+    block_chars = []
+    
+    for x0, y0, x1, y1, word, _, _, _ in words:
+        box = (x0, y0, x1, y1)
+        if block_chars:
+            block_chars.append((*prev_box, FLAG_SPACE | FLAG_CONTINUATION))
+        block_chars.append((*box, 0))
+        block_chars.extend([(*box, FLAG_CONTINUATION)] * (len(word) - 1))
+        prev_box = box
+    
+    return " ".join(w[4] for w in words), block_chars
+
+def _in_any_region(points: np.ndarray, regions: np.ndarray) -> np.ndarray:
+    """
+    Tests which (x, y) points lie inside any of the (x0, y0, x1, y1) regions.
+    
+    Uses the same half-open bounds as `fitz.Point in fitz.Rect`.
+    """
+    if not len(points) or not len(regions):
+        return np.zeros(len(points), dtype=bool)
+    x = points[:, 0, None]
+    y = points[:, 1, None]
+    inside = (
+        (x >= regions[:, 0]) & (x < regions[:, 2]) &
+        (y >= regions[:, 1]) & (y < regions[:, 3])
+    )
+    return inside.any(axis=1)
+
+def _process_page(page: fitz.Page):
+    """
+    Extracts the filtered text of a single page.
+    
+    Returns:
+        page_text (str), boxes (float32 array of shape (N, 4)),
+        flags (uint8 array of shape (N,)) and page size (width, height).
+    """
+    page_height = page.rect.height
+    page_width = page.rect.width
+    
+    page_parts = []
+    # (x0, y0, x1, y1, flags) for each char on this page
+    page_chars = []
+    
+    # 1. Detect Tables
+    tables = page.find_tables() if DETECT_TABLES else []
+    table_bboxes = np.asarray([tuple(t.bbox) for t in tables], dtype=np.float64).reshape(-1, 4)
+    
+    # 2. Detect Images
+    image_bboxes = []
+    for img in page.get_images():
+        rects = page.get_image_rects(img[0])
+        image_bboxes.extend(tuple(r) for r in rects)
+    image_bboxes = np.asarray(image_bboxes, dtype=np.float64).reshape(-1, 4)
         
-        for block in sorted_blocks:
-            bbox = fitz.Rect(block["bbox"])
-            
-            # --- FILTERING ---
-            if bbox.y1 < header_height or bbox.y0 > footer_y: continue # Header/Footer
+    # 3. Define Header/Footer Regions (5% margin)
+    header_height = page_height * 0.05
+    footer_y = page_height * 0.95
+    
+    # 4. Get Text blocks as (bbox, payload) pairs
+    text_page = page.get_textpage(flags=TEXT_FLAGS)
+    if CHAR_LEVEL_BBOX:
+        # rawdict provides individual characters
+        blocks = page.get_text("rawdict", textpage=text_page).get("blocks", [])
+        text_blocks = [(b["bbox"], b) for b in blocks if b.get("type") == 0]
+        build_block = _block_chars
+    else:
+        words_by_block = {}
+        for w in page.get_text("words", textpage=text_page):
+            words_by_block.setdefault(w[5], []).append(w)
+        text_blocks = [
+            (b[:4], words_by_block[b[5]])
+            for b in page.get_text("blocks", textpage=text_page)
+            if b[6] == 0 and b[5] in words_by_block
+        ]
+        build_block = _block_words
+    
+    # 5. Filter Blocks for all blocks of the page at once
+    block_bboxes = np.asarray([b[0] for b in text_blocks], dtype=np.float64).reshape(-1, 4)
+    keep = (block_bboxes[:, 3] >= header_height) & (block_bboxes[:, 1] <= footer_y) # Header/Footer
+    
+    # Check center point for Table/Image overlap
+    block_centers = np.column_stack((
+        (block_bboxes[:, 0] + block_bboxes[:, 2]) / 2,
+        (block_bboxes[:, 1] + block_bboxes[:, 3]) / 2,
+    ))
+    keep &= ~_in_any_region(block_centers, table_bboxes) # Table
+    keep &= ~_in_any_region(block_centers, image_bboxes) # Image
+    
+    # 6. Sort Blocks (Top-to-bottom, Left-to-right)
+    # We use a smaller vertical tolerance (10px) to group lines better
+    # np.lexsort is stable and sorts by its last key first
+    kept = np.flatnonzero(keep)
+    order = kept[np.lexsort((block_bboxes[kept, 0], block_bboxes[kept, 1] // 10))]
+    sorted_blocks = [text_blocks[i] for i in order.tolist()]
+    
+    for _, block in sorted_blocks:
+        block_text, block_chars = build_block(block)
+
+        if block_text.strip():
+            # Remove trailing whitespace from block_text AND char_map to keep them in sync
+            stripped = block_text.rstrip()
+            del block_chars[len(stripped):]
+            block_text = stripped
             
-            # Check center point for Table/Image overlap
-            block_center = fitz.Point((bbox.x0 + bbox.x1)/2, (bbox.y0 + bbox.y1)/2)
+            # Add to full text
+            page_parts.append(block_text)
+            page_chars.extend(block_chars)
             
-            if any(block_center in t_bbox for t_bbox in table_bboxes): continue # Table
-            if any(block_center in i_bbox for i_bbox in image_bboxes): continue # Image
-            # --- END FILTERING ---
+            # Always use double newline separator for blocks
+            # This ensures nlp.py treats them as separate sentences
+            separator = "\n\n"
             
-            block_text = ""
-            block_chars = []
+            page_parts.append(separator)
             
-            for line in block.get("lines", []):
-                line_text = ""
-                line_chars = []
-                
-                # Sort spans
-                spans = sorted(line.get("spans", []), key=lambda s: s["bbox"][0])
-                
-                for span in spans:
-                    # rawdict 'chars' list contains individual characters
-                    chars = span.get("chars", [])
-                    
-                    for char_info in chars:
-                        c = char_info.get("c", "")
-                        if not c: continue
-                        
-                        # rawdict gives exact bbox for the character
-                        c_bbox = char_info.get("bbox", [0,0,0,0])
-                        
-                        # Convert to bottom-left origin
-                        # PyMuPDF y0 is top edge.
-                        # pdfminer y0 is bottom edge (from bottom).
-                        # y_bottom = page_height - y_top - height
-                        c_height = c_bbox[3] - c_bbox[1]
-                        c_y_bottom = page_height - c_bbox[1] - c_height
-                        
-                        line_text += c
-                        line_chars.append({
-                            "page": page_num + 1,
-                            "x": c_bbox[0],
-                            "y": c_y_bottom,
-                            "width": c_bbox[2] - c_bbox[0],
-                            "height": c_height,
-                            "page_height": page_height,
-                            "page_width": page_width
-                        })
-                
-                if line_text:
-                    block_text += line_text
-                    block_chars.extend(line_chars)
-                    # Add space if line doesn't end with whitespace
-                    if not line_text.endswith((" ", "\n", "\t")):
-                        block_text += " "
-                        if line_chars:
-                            last = line_chars[-1]
-                            block_chars.append({
-                                "page": last["page"],
-                                "x": last["x"] + last["width"],
-                                "y": last["y"],
-                                "width": last["width"], # approximate space width
-                                "height": last["height"],
-                                "page_height": last["page_height"],
-                                "page_width": last["page_width"],
-                                "is_space": True
-                            })
-
-            if block_text.strip():
-                # Remove trailing whitespace from block_text AND char_map to keep them in sync
-                while block_text and block_text[-1].isspace():
-                    block_text = block_text[:-1]
-                    if block_chars:
-                        block_chars.pop()
-                
-                # Add to full text
-                full_text += block_text
-                char_map.extend(block_chars)
-                
-                # Always use double newline separator for blocks
-                # This ensures nlp.py treats them as separate sentences
-                separator = "\n\n"
-                
-                full_text += separator
-                
-                # Add newline markers to char_map
-                if block_chars:
-                    last = block_chars[-1]
-                    for _ in range(2): # Add 2 newlines
-                        char_map.append({
-                            "page": last["page"],
-                            "x": last["x"],
-                            "y": last["y"],
-                            "width": 0,
-                            "height": last["height"],
-                            "page_height": last["page_height"],
-                            "page_width": last["page_width"],
-                            "is_newline": True
-                        })
-    
-    doc.close()
+            # Add newline markers to char_map
+            if block_chars:
+                x0, y0, _, y1, _ = block_chars[-1]
+                for _ in range(2): # Add 2 newlines
+                    page_chars.append((x0, y0, x0, y1, FLAG_NEWLINE))
+    
+    # Convert to (x, y, width, height) with a bottom-left origin in one pass
+    # PyMuPDF y0 is top edge.
+    # pdfminer y0 is bottom edge (from bottom).
+    # y_bottom = page_height - y1
+    rows = np.asarray(page_chars, dtype=np.float32).reshape(-1, 5)
+    boxes = np.empty((len(rows), 4), dtype=np.float32)
+    boxes[:, 0] = rows[:, 0]
+    boxes[:, 1] = page_height - rows[:, 3]
+    boxes[:, 2] = rows[:, 2] - rows[:, 0]
+    boxes[:, 3] = rows[:, 3] - rows[:, 1]
+    return "".join(page_parts), boxes, rows[:, 4].astype(np.uint8), (page_width, page_height)
+
+def _open(source):
+    """Opens a PDF from a file path (read by MuPDF directly) or from bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source, filetype="pdf")
+
+def _process_pages(source, start: int, stop: int):
+    """Runs _process_page over pages [start, stop) of its own copy of the document."""
+    doc = _open(source)
+    try:
+        return [_process_page(doc[page_num]) for page_num in range(start, stop)]
+    finally:
+        doc.close()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+def shutdown_executor():
+    """Stops the parsing worker processes, if any were started."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+def extract_text_with_coordinates(source):
+    """
+    Extracts text and character coordinates from a PDF path or PDF bytes using PyMuPDF.
+    
+    Passing a path is preferred: MuPDF reads the file itself instead of keeping
+    another copy of the bytes in memory, and workers only receive the path.
+    
+    Features:
+    - Uses `words` for word bounding boxes, or `rawdict` for exact character
+      bounding boxes when CHAR_LEVEL_BBOX is set.
+    - Filters headers/footers and images, and tables when DETECT_TABLES is set.
+    - Enforces double newlines for block separation.
+    
+    Returns:
+        full_text (str): The complete text of the PDF.
+        char_map (dict): Parallel arrays with one entry per char of full_text:
+            "page" (int16), "x", "y", "width", "height" (float32) and "flags"
+            (uint8, see FLAG_*), plus "page_sizes" mapping page -> (width, height).
+    """
+    doc = _open(source)
+    page_count = len(doc)
+    
+    if PARSE_WORKERS > 1 and page_count >= PARALLEL_MIN_PAGES:
+        doc.close()
+        # Split the document into one contiguous page range per worker
+        step = -(-page_count // PARSE_WORKERS)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        futures = [_get_executor().submit(_process_pages, source, start, stop) for start, stop in ranges]
+        pages = [page for future in futures for page in future.result()]
+    else:
+        pages = [_process_page(page) for page in doc]
+        doc.close()
+    
+    full_text = "".join(page_text for page_text, _, _, _ in pages)
+    boxes = np.concatenate([b for _, b, _, _ in pages] or [np.zeros((0, 4), dtype=np.float32)])
+    flags = np.concatenate([f for _, _, f, _ in pages] or [np.zeros(0, dtype=np.uint8)])
+    counts = np.array([len(f) for _, _, f, _ in pages], dtype=np.intp)
+    
+    char_map = {
+        "page": np.repeat(np.arange(1, len(pages) + 1, dtype=np.int16), counts),
+        "x": boxes[:, 0],
+        "y": boxes[:, 1],
+        "width": boxes[:, 2],
+        "height": boxes[:, 3],
+        "flags": flags,
+        "page_sizes": {page_num + 1: size for page_num, (_, _, _, size) in enumerate(pages)},
+    }
     return full_text, char_map
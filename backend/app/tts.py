@@ -1,5 +1,7 @@
 import os
+import struct
 import tempfile
+import numpy as np
 import soundfile as sf
 
 from app.helper import load_text_to_speech, load_voice_style
@@ -18,16 +20,19 @@ class SupertonicTTS:
         self.sample_rate = self.tts.sample_rate
         self.default_style = load_voice_style([os.path.join(VOICE_STYLES_DIR, "M1.json")], verbose=False)
 
-    def synthesize(self, text: str, voice_style: str = "M1.json", speed: float = 1.0):
+    def load_style(self, voice_style: str):
         # Construct full path to the voice style
         style_path = os.path.join(VOICE_STYLES_DIR, voice_style)
         
         if os.path.exists(style_path):
-            style = load_voice_style([style_path], verbose=False)
-        else:
-            # Fallback to default if not found
-            print(f"Voice style {voice_style} not found, using default.")
-            style = self.default_style
+            return load_voice_style([style_path], verbose=False)
+        # Fallback to default if not found
+        print(f"Voice style {voice_style} not found, using default.")
+        return self.default_style
+
+    def synthesize(self, text: str, voice_style: str = "M1.json", speed: float = 1.0, style=None):
+        if style is None:
+            style = self.load_style(voice_style)
 
         # Ensure speed is within reasonable bounds
         speed = max(0.5, min(speed, 2.0))
@@ -42,6 +47,34 @@ class SupertonicTTS:
         sf.write(out_path, audio, sr, subtype="PCM_16")
         return out_path
 
+    def synthesize_stream(self, texts: list, voice_style: str = "M1.json", speed: float = 1.0):
+        """Yields a streaming WAV header, then the 16-bit PCM of each text as soon as it is synthesized."""
+        style = self.load_style(voice_style)
+        yield wav_stream_header(self.sample_rate)
+        for text in texts:
+            audio, _ = self.synthesize(text, voice_style, speed, style=style)
+            yield pcm16(audio)
+
+def _wav_header(sample_rate: int, channels: int, riff_size: int, data_size: int) -> bytes:
+    block_align = channels * 2
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16,
+        b"data", data_size,
+    )
+
+def wav_header(sample_rate: int, data_size: int, channels: int = 1) -> bytes:
+    """RIFF/WAVE header for `data_size` bytes of 16-bit PCM."""
+    return _wav_header(sample_rate, channels, 36 + data_size, data_size)
+
+def wav_stream_header(sample_rate: int, channels: int = 1) -> bytes:
+    """RIFF/WAVE header for 16-bit PCM of unknown length (sizes set to the maximum)."""
+    return _wav_header(sample_rate, channels, 0xFFFFFFFF, 0xFFFFFFFF)
+
+def pcm16(audio: np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
 _tts = SupertonicTTS()
 
 def tts_sentence_to_wav(sentence_text: str, out_dir: str, voice_style: str = "M1.json", speed: float = 1.0) -> str:
@@ -50,6 +83,9 @@ def tts_sentence_to_wav(sentence_text: str, out_dir: str, voice_style: str = "M1
     os.close(fd)
     return _tts.synthesize_to_file(sentence_text, tmp, voice_style, speed)
 
+def tts_stream_wav(texts: list, voice_style: str = "M1.json", speed: float = 1.0):
+    return _tts.synthesize_stream(texts, voice_style, speed)
+
 def list_voice_styles():
     if not os.path.exists(VOICE_STYLES_DIR):
         return []
@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+import queue
+import threading
+
+from .tts import _tts, pcm16, wav_header
+
+# Number of sentences after the one being played to synthesize ahead of time
+PREFETCH_AHEAD = int(os.environ.get("TTS_PREFETCH_AHEAD", "3"))
+
+def _tts_worker(in_q, out_q, generation, playhead, window_voice, window_speed):
+    """
+    Subprocess entry point. Importing this module loads the TTS model once;
+    the worker then synthesizes (generation, (sentence_id, voice, speed), voice_id, text)
+    items for as long as the app runs and answers each with
+    (generation, key, status, pcm_bytes, sample_rate), status being "ok",
+    "skipped" or "failed".
+
+    The current window is shared as `playhead`, `window_voice` (a voice id) and
+    `window_speed`.
+    """
+    styles = {}
+    while (item := in_q.get()) is not None:
+        item_generation, key, voice_id, text = item
+        sentence_id, voice, speed = key
+
+        # A new PDF was uploaded, or the listener jumped elsewhere or changed
+        # voice or speed; don't spend time on audio nobody will play
+        if (
+            item_generation != generation.value
+            or voice_id != window_voice.value
+            or speed != window_speed.value
+            or not playhead.value <= sentence_id <= playhead.value + PREFETCH_AHEAD
+        ):
+            out_q.put((item_generation, key, "skipped", None, None))
+            continue
+
+        try:
+            if voice not in styles:
+                styles[voice] = _tts.load_style(voice)
+            audio, sample_rate = _tts.synthesize(text, voice, speed, style=styles[voice])
+        except Exception as e:
+            # Only this sentence falls back to on-demand synthesis
+            print(f"Prefetching sentence {sentence_id} failed: {e!r}")
+            out_q.put((item_generation, key, "failed", None, None))
+            continue
+        out_q.put((item_generation, key, "ok", pcm16(audio), sample_rate))
+
+class TTSPrefetcher:
+    """
+    Synthesizes the sentences of the current PDF in a worker process, a few
+    sentences ahead of the one being played, in the voice and speed of the last
+    request.
+
+    The worker is started once and kept for the lifetime of the app, so the
+    TTS model is loaded only once; each upload bumps a generation counter that
+    makes the worker skip sentences of the previous PDF. Audio is keyed by
+    (sentence_id, voice, speed) and only the window
+    [playhead, playhead + PREFETCH_AHEAD] is queued and kept in memory. There
+    is a single current PDF, identified by its upload id, matching the
+    single-user design of the app.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._upload_id = None
+        self._texts = []
+        self._process = None
+        self._in_q = None
+        self._generation = 0
+        self._shared_generation = None
+        self._playhead = None
+        self._window_voice = None
+        self._window_speed = None
+        self._voice_ids = {}  # voice -> id shared with the worker
+        self._window = set()  # keys of the sentences currently worth keeping
+        self._queued = set()  # keys sent to the worker and not answered yet
+        self._audio = {}      # key -> (pcm bytes, sample rate), or None if synthesis failed
+
+    def warm_up(self):
+        """Starts the worker so the TTS model is loaded before the first upload."""
+        with self._cond:
+            self._ensure_worker()
+
+    def start(self, upload_id: str, texts: list):
+        """
+        Makes `texts` the current PDF. Nothing is synthesized until the first
+        `get`, which tells the voice and speed to prefetch with.
+        """
+        with self._cond:
+            self._upload_id = upload_id
+            self._texts = list(texts)
+            self._generation += 1
+            self._window = set()
+            self._queued.clear()
+            self._audio.clear()
+
+    def stop(self):
+        with self._cond:
+            if self._process is not None:
+                self._process.terminate()
+                self._process.join(timeout=5)
+            self._process = None
+            self._in_q = None
+            self._upload_id = None
+            self._texts = []
+            self._window = set()
+            self._queued.clear()
+            self._audio.clear()
+            self._cond.notify_all()
+
+    def has_sentence(self, upload_id: str, sentence_id: int) -> bool:
+        return upload_id == self._upload_id and 0 <= sentence_id < len(self._texts)
+
+    def get(self, upload_id: str, sentence_id: int, voice: str = "M1.json", speed: float = 1.0):
+        """
+        Waits for the worker to synthesize a sentence of the current PDF.
+
+        Returns the sentence as WAV bytes, or None if it is not available (a new
+        PDF was uploaded, or synthesis failed or was abandoned).
+        """
+        key = (sentence_id, voice, speed)
+        with self._cond:
+            if not self.has_sentence(upload_id, sentence_id):
+                return None
+            generation = self._generation
+            self._request_window(sentence_id, voice, speed)
+            while key not in self._audio:
+                if generation != self._generation or key not in self._queued:
+                    return None
+                self._cond.wait(timeout=1.0)
+            audio = self._audio[key]
+
+        if audio is None:
+            return None
+        chunk, sample_rate = audio
+        return wav_header(sample_rate, len(chunk)) + chunk
+
+    def _ensure_worker(self):
+        """(Re)starts the worker if it is not running, e.g. after it crashed."""
+        if self._process is not None and self._process.is_alive():
+            return
+        ctx = multiprocessing.get_context("spawn")
+        self._in_q = ctx.Queue()
+        out_q = ctx.Queue()
+        self._shared_generation = ctx.Value("i", self._generation, lock=False)
+        self._playhead = ctx.Value("i", 0, lock=False)
+        self._window_voice = ctx.Value("i", -1, lock=False)
+        self._window_speed = ctx.Value("d", 0.0, lock=False)
+        self._process = ctx.Process(
+            target=_tts_worker,
+            args=(
+                self._in_q, out_q, self._shared_generation,
+                self._playhead, self._window_voice, self._window_speed,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        # Items queued for the previous worker are lost
+        self._queued.clear()
+        threading.Thread(target=self._drain, args=(self._process, out_q), daemon=True).start()
+
+    def _request_window(self, sentence_id: int, voice: str, speed: float):
+        self._ensure_worker()
+        self._shared_generation.value = self._generation
+        self._window_voice.value = self._voice_ids.setdefault(voice, len(self._voice_ids))
+        self._window_speed.value = speed
+        self._playhead.value = sentence_id
+        window = range(sentence_id, min(sentence_id + PREFETCH_AHEAD + 1, len(self._texts)))
+        keys = [(i, voice, speed) for i in window]
+        self._window = set(keys)
+
+        # Free audio that is no longer ahead of the listener
+        for key in set(self._audio) - self._window:
+            del self._audio[key]
+
+        for key in keys:
+            if key not in self._audio and key not in self._queued:
+                self._enqueue(key)
+
+    def _enqueue(self, key):
+        self._in_q.put((self._generation, key, self._voice_ids[key[1]], self._texts[key[0]]))
+        self._queued.add(key)
+
+    def _drain(self, process, out_q):
+        while True:
+            try:
+                generation, key, status, chunk, sample_rate = out_q.get(timeout=1.0)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._cond:
+                if process is not self._process:
+                    break
+                # Answers for a previous PDF
+                if generation != self._generation:
+                    continue
+                self._queued.discard(key)
+                if key in self._window:
+                    if status == "ok":
+                        self._audio[key] = (chunk, sample_rate)
+                    elif status == "failed":
+                        self._audio[key] = None
+                    else:
+                        # Skipped while the playhead was elsewhere, but wanted again since
+                        self._enqueue(key)
+                self._cond.notify_all()
+
+        # Wake up requests waiting on a worker that is gone
+        with self._cond:
+            if process is self._process:
+                self._queued.clear()
+            self._cond.notify_all()
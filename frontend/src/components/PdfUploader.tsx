@@ -1,7 +1,10 @@
 import { Button } from "@mui/material";
 import React, { useRef } from "react";
+import { PageSizes } from "./PdfViewer";
 
-type Props = { onUploaded: (data: { sentences: any[]; pdfUrl: string }) => void };
+type Props = {
+  onUploaded: (data: { sentences: any[]; pages: PageSizes; uploadId: string; pdfUrl: string }) => void;
+};
 
 export default function PdfUploader({ onUploaded }: Props) {
   const inputId = "pdf-upload-input";
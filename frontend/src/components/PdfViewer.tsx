@@ -7,16 +7,17 @@ import 'react-pdf/dist/esm/Page/TextLayer.css';
 // Set worker source
 pdfjs.GlobalWorkerOptions.workerSrc = `//unpkg.com/pdfjs-dist@${pdfjs.version}/build/pdf.worker.min.mjs`;
 
+// Bottom-left origin, in PDF points of page `p`
 type BBox = {
-    page: number;
+    p: number;
     x: number;
     y: number;
-    width: number;
-    height: number;
-    page_height: number;
-    page_width: number;
+    w: number;
+    h: number;
 };
 
+export type PageSizes = { [page: string]: { w: number; h: number } };
+
 type Sentence = {
     id: number;
     text: string;
@@ -25,13 +26,14 @@ type Sentence = {
 
 type Props = {
     pdfUrl: string;
+    pages: PageSizes;
     sentences: Sentence[];
     currentId: number | null;
     onJump: (id: number) => void;
     autoScroll: boolean;
 };
 
-export default function PdfViewer({ pdfUrl, sentences, currentId, onJump, autoScroll }: Props) {
+export default function PdfViewer({ pdfUrl, pages, sentences, currentId, onJump, autoScroll }: Props) {
     const [numPages, setNumPages] = useState<number | null>(null);
     const [pageWidth, setPageWidth] = useState<number>(600); // Default width
     const containerRef = useRef<HTMLDivElement>(null);
@@ -67,9 +69,12 @@ export default function PdfViewer({ pdfUrl, sentences, currentId, onJump, autoSc
 
     // Group bboxes by page for rendering overlays
     const getPageOverlays = (pageNumber: number) => {
+        const page = pages[pageNumber];
+        if (!page) return null;
+
         return sentences.map((sentence) => {
             // Filter bboxes for this page
-            const pageBBoxes = sentence.bboxes.filter(b => b.page === pageNumber);
+            const pageBBoxes = sentence.bboxes.filter(b => b.p === pageNumber);
             if (pageBBoxes.length === 0) return null;
 
             return (
@@ -96,7 +101,7 @@ export default function PdfViewer({ pdfUrl, sentences, currentId, onJump, autoSc
                             }}
                             style={{
                                 position: 'absolute',
-                                left: `${(bbox.x / bbox.page_width) * 100}%`,
+                                left: `${(bbox.x / page.w) * 100}%`,
                                 // PDF coordinates are usually from bottom-left, but pdfminer might give them differently.
                                 // If y is from bottom: top = 100 - (y + height)/page_height * 100
                                 // If y is from top: top = y/page_height * 100
@@ -105,9 +110,9 @@ export default function PdfViewer({ pdfUrl, sentences, currentId, onJump, autoSc
                                 // Wait, bbox.y is y0 (bottom). y1 = y0 + height.
                                 // So top corresponds to y1 (top edge of char).
                                 // top % = (page_height - (bbox.y + bbox.height)) / page_height * 100
-                                top: `${((bbox.page_height - (bbox.y + bbox.height)) / bbox.page_height) * 100}%`,
-                                width: `${(bbox.width / bbox.page_width) * 100}%`,
-                                height: `${(bbox.height / bbox.page_height) * 100}%`,
+                                top: `${((page.h - (bbox.y + bbox.h)) / page.h) * 100}%`,
+                                width: `${(bbox.w / page.w) * 100}%`,
+                                height: `${(bbox.h / page.h) * 100}%`,
                                 backgroundColor: sentence.id === currentId ? 'rgba(255, 255, 0, 0.4)' : 'transparent',
                                 cursor: 'pointer',
                                 pointerEvents: 'auto', // Enable clicks on the highlight box
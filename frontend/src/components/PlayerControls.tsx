@@ -1,17 +1,18 @@
 import React, { useEffect, useRef, useState } from "react";
 import { Button, Stack, Select, MenuItem, Slider, Typography, FormControl, InputLabel } from "@mui/material";
-import { ttsSentence, getVoices } from "../lib/tts-api";
+import { ttsAudioUrl, ttsSentenceStreamUrl, getVoices } from "../lib/tts-api";
 
 type Sentence = { id: number; text: string };
 
 type Props = {
+  uploadId: string;
   sentences: Sentence[];
   currentId: number | null;                // highlight only
   onCurrentChange: (id: number | null) => void;
   playRequestId: number | null;            // explicit command to play now
 };
 
-export default function PlayerControls({ sentences, currentId, onCurrentChange, playRequestId }: Props) {
+export default function PlayerControls({ uploadId, sentences, currentId, onCurrentChange, playRequestId }: Props) {
   const audioRef = useRef<HTMLAudioElement>(null);
   const [isPlaying, setIsPlaying] = useState(false);
   const [voices, setVoices] = useState<string[]>([]);
@@ -53,16 +54,17 @@ export default function PlayerControls({ sentences, currentId, onCurrentChange,
     onCurrentChange(id);
 
     try {
-      const { audioUrl } = await ttsSentence(s.text, selectedVoice, speed);
-
-      // Check if we are still supposed to be playing this sentence (race condition check)
-      // Note: A more robust way would be to use a request ID or cancellation token, 
-      // but checking currentId matches is a reasonable proxy if onCurrentChange updates it synchronously.
-      // However, since we might have moved on, let's just proceed. 
-      // Ideally, we should check if the component is still mounted or if another request started.
-
-      audio.src = audioUrl;
-      await audio.play();
+      // Playback starts as soon as the first audio chunk arrives
+      audio.src = ttsSentenceStreamUrl(uploadId, id, selectedVoice, speed);
+      try {
+        await audio.play();
+      } catch (e) {
+        // The server has no audio for this sentence (another PDF was uploaded since,
+        // the server restarted or synthesis failed)
+        if ((e as DOMException).name !== "NotSupportedError") throw e;
+        audio.src = await ttsAudioUrl(s.text, selectedVoice, speed);
+        await audio.play();
+      }
       setIsPlaying(true);
 
       // Attach ended handler for this playback
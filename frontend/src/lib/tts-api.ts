@@ -23,3 +23,28 @@ export async function ttsSentence(text: string, voice: string, speed: number): P
 
     return res.json();
 }
+
+// Longest query string sent to /tts_stream; proxies and servers reject longer URLs
+const MAX_STREAM_QUERY_LENGTH = 4000;
+
+// Audio is streamed as it is synthesized, so it can be used directly as an <audio> src
+export function ttsStreamUrl(text: string, voice: string, speed: number): string {
+    const params = new URLSearchParams({ text, voice, speed: String(speed) });
+    return `${API_BASE}/tts_stream?${params}`;
+}
+
+// Streams short texts; texts too long for a URL are synthesized with a POST to /tts instead
+export async function ttsAudioUrl(text: string, voice: string, speed: number): Promise<string> {
+    const url = ttsStreamUrl(text, voice, speed);
+    if (url.length - API_BASE.length <= MAX_STREAM_QUERY_LENGTH) {
+        return url;
+    }
+    const { audioUrl } = await ttsSentence(text, voice, speed);
+    return audioUrl;
+}
+
+// Audio for a sentence of an uploaded PDF, synthesized ahead of playback by the server
+export function ttsSentenceStreamUrl(uploadId: string, sentenceId: number, voice: string, speed: number): string {
+    const params = new URLSearchParams({ voice, speed: String(speed) });
+    return `${API_BASE}/tts_stream/${encodeURIComponent(uploadId)}/${sentenceId}?${params}`;
+}
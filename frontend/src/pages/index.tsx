@@ -1,14 +1,16 @@
 import React, { useState, useEffect } from "react";
 import { Container, Stack, Typography, Box, Button } from "@mui/material";
 import PdfUploader from "../components/PdfUploader";
-import PdfViewer from "../components/PdfViewer";
+import PdfViewer, { PageSizes } from "../components/PdfViewer";
 import PlayerControls from "../components/PlayerControls";
 
 type Sentence = { id: number; text: string; bboxes: any[] };
 
 export default function Home() {
   const [sentences, setSentences] = useState<Sentence[]>([]);
+  const [pages, setPages] = useState<PageSizes>({});
   const [pdfUrl, setPdfUrl] = useState<string | null>(null);
+  const [uploadId, setUploadId] = useState<string>("");
   const [currentId, setCurrentId] = useState<number | null>(null);
   const [playRequestId, setPlayRequestId] = useState<number | null>(null);
   const [autoScroll, setAutoScroll] = useState(true);
@@ -24,6 +26,8 @@ export default function Home() {
           </Typography>
           <PdfUploader onUploaded={(data) => {
             setSentences(data.sentences);
+            setPages(data.pages);
+            setUploadId(data.uploadId);
             setPdfUrl(`${data.pdfUrl}?t=${Date.now()}`);
             setCurrentId(null);
             setPlayRequestId(null);
@@ -42,6 +46,7 @@ export default function Home() {
           <Box sx={{ flex: 1, overflow: "hidden", px: 2, position: 'relative' }}>
             <PdfViewer
               pdfUrl={pdfUrl}
+              pages={pages}
               sentences={sentences}
               currentId={currentId}
               onJump={(id) => {
@@ -54,6 +59,7 @@ export default function Home() {
 
           <Box sx={{ p: 2 }}>
             <PlayerControls
+              uploadId={uploadId}
               sentences={sentences}
               currentId={currentId}
               onCurrentChange={(id) => {